@@ -2,15 +2,19 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
-import os, re, sys, html, logging, smtplib, json
+import os, re, sys, html, hashlib, logging, smtplib, json, threading
+from io import BytesIO
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List, Optional, Dict, Tuple
+from typing import List, NamedTuple, Optional, Dict, Tuple
 from email.message import EmailMessage
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
-from jinja2 import Template
+from jinja2 import Environment, select_autoescape
+from lxml import etree
 import gspread
 from gspread.exceptions import APIError, SpreadsheetNotFound, WorksheetNotFound
 from playwright.sync_api import TimeoutError as PlaywrightTimeoutError, sync_playwright
@@ -26,6 +30,26 @@ EPISODE_LABEL_RE = re.compile(
     r"^Odcinek\s+(\d+)(?:\s*[-–]\s*Finał)?$",
     re.IGNORECASE,
 )
+# Niezamknięty akapit kończy się na następnym znaczniku blokowym (jak w
+# parserze HTML), żeby nie sklejać kolejnych nagłówków w jeden tekst.
+BLOCK_TAG = r"</?(?:p|div|section|article|ul|ol|li|table|tr|td|h[1-6]|body)\b"
+# Nazwy znaczników są bez względu na wielkość liter, ale klasa `toggler` –
+# jak wcześniej w BeautifulSoup – musi się zgadzać dokładnie.
+TOGGLER_RE = re.compile(
+    r"""<p\b[^>]*\bclass\s*=\s*(?:"[^"]*(?-i:toggler)[^"]*"|'[^']*(?-i:toggler)[^']*')[^>]*>"""
+    rf"""((?:(?!{BLOCK_TAG}).)*?)(?:</p\s*>|(?={BLOCK_TAG})|$)""",
+    re.DOTALL | re.IGNORECASE,
+)
+# Komentarze i treść skryptów/szablonów nie są częścią strony widocznej dla
+# parsera HTML, więc wycinamy je przed szukaniem nagłówków.
+NON_CONTENT_RE = re.compile(
+    r"<!--.*?-->|<(script|style|template)\b.*?</\1\s*>",
+    re.DOTALL | re.IGNORECASE,
+)
+HTML_TAG_RE = re.compile(r"<[^>]*>")
+IMG_TAG_RE = re.compile(r"<img\b", re.IGNORECASE)
+NON_DIGIT_RE = re.compile(r"\D")
+STRIP_NON_DIGITS = {i: None for i in range(256) if not chr(i).isdecimal()}
 
 DEFAULT_USER_AGENT = (
     "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
@@ -46,6 +70,18 @@ DEFAULT_SUBMIT_SELECTOR = os.environ.get(
     "button[type='submit'], input[type='submit'], #wp-submit",
 )
 AUTH_RECOVERY_MAX_ATTEMPTS = 2
+DEFAULT_FETCH_MAX_WORKERS = 16
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+DEFAULT_HTTP_CACHE_FILE = ".http_cache.json"
+# Podnieś przy każdej zmianie reguł parsowania odcinków, żeby unieważnić
+# wyniki zapisane w cache przez poprzednią wersję parsera.
+HTTP_CACHE_VERSION = 1
+MAX_PAGE_BYTES = 5 * 1024 * 1024
+PAGE_CHUNK_SIZE = 64 * 1024
+AUTH_RECOVERY_LOCK = threading.Lock()
+# Zwiększany po każdym udanym logowaniu; pozwala wątkowi, który dostał stronę
+# logowania, sprawdzić, czy inny wątek nie odświeżył już sesji.
+auth_generation = 0
 
 COLUMN_ALIASES: Dict[str, List[str]] = {
     "nazwa": ["nazwa", "tytuł", "tytul"],
@@ -60,7 +96,11 @@ COLUMN_ALIASES: Dict[str, List[str]] = {
     ],
 }
 
-HTML_TEMPLATE = Template(r"""<!DOCTYPE html>
+TEMPLATE_ENV = Environment(
+    autoescape=select_autoescape(default_for_string=True),
+    auto_reload=False,
+)
+HTML_TEMPLATE = TEMPLATE_ENV.from_string(r"""<!DOCTYPE html>
 <html lang="pl">
 <head>
 <meta charset="utf-8">
@@ -86,17 +126,17 @@ HTML_TEMPLATE = Template(r"""<!DOCTYPE html>
 <table class="main" role="presentation" cellpadding="0" cellspacing="0">
 <tr><td class="header"><h1>Twoje nowe odcinki z DramaQueen</h1></td></tr>
 
-{% if new_items and new_items|length > 0 %}
+{% if new_items %}
   {% for d in new_items %}
     <tr><td class="episode-block">
-      <h2 class="episode-title">{{ d.get('tytuł') or d.get('nazwa') }}</h2>
+      <h2 class="episode-title">{{ d.tytul }}</h2>
       <p class="episode-update">
-        <strong>Update</strong>: obejrzano odcinek <strong>{{ d.get('ostatni_obejrzany') }}</strong>
-        {% if d.get('liczba_odcinków') %} z <strong>{{ d.get('liczba_odcinków') }}</strong>{% endif %},
-        nowy odcinek: <strong>{{ d.get('nowy_odcinek') }}</strong>.
+        <strong>Update</strong>: obejrzano odcinek <strong>{{ d.ostatni_obejrzany }}</strong>
+        {% if d.liczba_odcinkow %} z <strong>{{ d.liczba_odcinkow }}</strong>{% endif %},
+        nowy odcinek: <strong>{{ d.nowy_odcinek }}</strong>.
       </p>
-      {% if d.get('link') %}
-        <a href="{{ d.get('link') }}" class="button" target="_blank">Zobacz nowy odcinek</a>
+      {% if d.link %}
+        <a href="{{ d.link }}" class="button" target="_blank">Zobacz nowy odcinek</a>
       {% endif %}
     </td></tr>
     {% if not loop.last %}<tr><td><hr class="divider"></td></tr>{% endif %}
@@ -107,7 +147,7 @@ HTML_TEMPLATE = Template(r"""<!DOCTYPE html>
 
 <tr><td><hr class="divider"></td></tr>
 <tr><td class="episode-block"><h2 class="episode-title">Problemy techniczne</h2>
-  {% if problems and problems|length > 0 %}
+  {% if problems %}
     <ul style="padding-left:18px;margin:8px 0">
       {% for p in problems %}<li style="margin-bottom:6px">{{ p }}</li>{% endfor %}
     </ul>
@@ -120,7 +160,7 @@ HTML_TEMPLATE = Template(r"""<!DOCTYPE html>
 </html>""")
 
 
-@dataclass
+@dataclass(slots=True)
 class SeriesRow:
     row_idx: int
     nazwa: str
@@ -134,13 +174,21 @@ class SeriesRow:
         return self.obejrzany_odcinek == self.odcinek_na_stronie == self.liczba_odcinków
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class EpisodeCheckResult:
     latest_ready: Optional[int]
     max_found: Optional[int]
     error: Optional[str] = None
 
 
+class NewItem(NamedTuple):
+    tytul: str
+    nowy_odcinek: int
+    ostatni_obejrzany: int
+    liczba_odcinkow: int
+    link: str
+
+
 @dataclass
 class UserConfig:
     sheet_title: str
@@ -231,6 +279,10 @@ def getenv_int(name: str, default: int) -> int:
         return default
 
 
+def fetch_max_workers() -> int:
+    return max(1, getenv_int("FETCH_MAX_WORKERS", DEFAULT_FETCH_MAX_WORKERS))
+
+
 def build_auth_config() -> AuthConfig:
     return AuthConfig(
         username=os.environ.get("DRAMAQUEEN_USERNAME"),
@@ -254,6 +306,9 @@ def build_auth_config() -> AuthConfig:
 
 
 def parse_int(value: object, default: int = 0) -> int:
+    # Komórki z arkusza to zwykle same cyfry – wtedy regex jest zbędny.
+    if type(value) is str and value.isdecimal():
+        return int(value)
     try:
         if isinstance(value, (int, float)):
             return int(value)
@@ -262,12 +317,16 @@ def parse_int(value: object, default: int = 0) -> int:
         s = str(value).strip()
         if not s:
             return default
-        return int(re.sub(r"\D", "", s))
+        digits = s.translate(STRIP_NON_DIGITS)
+        if not digits.isdecimal():
+            # Tabela obejmuje tylko Latin-1; pozostałe znaki usuwa regex.
+            digits = NON_DIGIT_RE.sub("", digits)
+        return int(digits)
     except Exception:
         return default
 
 
-def build_email_html(new_items: List[dict], problems: List[str]) -> str:
+def build_email_html(new_items: List[NewItem], problems: List[str]) -> str:
     new_items = new_items or []
     problems = problems or []
     try:
@@ -280,29 +339,59 @@ def build_email_html(new_items: List[dict], problems: List[str]) -> str:
 
 def extract_episode_number(text: str) -> Optional[int]:
     m = EPISODE_LABEL_RE.fullmatch((text or "").strip())
-    if m:
-        try:
-            return int(m.group(1))
-        except Exception:
-            return None
-    return None
+    return int(m.group(1)) if m else None
+
+
+def extract_togglers(html_text: str) -> List[Tuple[str, bool]]:
+    togglers = []
+    for m in TOGGLER_RE.finditer(NON_CONTENT_RE.sub(" ", html_text)):
+        inner = m.group(1)
+        text = html.unescape(HTML_TAG_RE.sub(" ", inner))
+        togglers.append((text, IMG_TAG_RE.search(inner) is not None))
+    return togglers
+
+
+def extract_togglers_with_lxml(html_text: str) -> List[Tuple[str, bool]]:
+    if not html_text.strip():
+        return []
+    togglers = []
+    for _, el in etree.iterparse(
+        BytesIO(html_text.encode("utf-8")),
+        events=("end",),
+        html=True,
+        encoding="utf-8",
+    ):
+        if el.tag == "p":
+            if "toggler" in (el.get("class") or ""):
+                text = " ".join(t.strip() for t in el.itertext() if t.strip())
+                togglers.append((text, el.find(".//img") is not None))
+        elif next(el.iterancestors("p"), None) is not None:
+            # Treść akapitu jest potrzebna w całości, aż do jego końca.
+            continue
+        # Zwalniamy przetworzone elementy razem z wcześniejszym rodzeństwem,
+        # żeby nie trzymać całego drzewa w pamięci.
+        el.clear(keep_tail=True)
+        while el.getprevious() is not None:
+            del el.getparent()[0]
+    return togglers
 
 
 def find_episodes(html_text: str) -> EpisodeCheckResult:
     try:
-        soup = BeautifulSoup(html_text, "html.parser")
-        p_tags = soup.find_all("p", class_=lambda c: c and "toggler" in c)
+        # Regex wystarcza dla typowego HTML serwisu; parser lxml zostaje
+        # jako zapas, gdy znaczniki nie pasują do prostego wzorca.
+        togglers = extract_togglers(html_text) or extract_togglers_with_lxml(html_text)
         latest_ready = None
         max_found = None
-        for p in p_tags:
-            num = extract_episode_number(p.get_text(" ", strip=True))
-            if num is not None:
-                if max_found is None or num > max_found:
-                    max_found = num
-            has_img = p.find("img") is not None
-            if not has_img and num is not None:
-                if latest_ready is None or num > latest_ready:
-                    latest_ready = num
+        for text, has_img in togglers:
+            num = extract_episode_number(text)
+            if num is None:
+                continue
+            if max_found is None or num > max_found:
+                max_found = num
+            if has_img or (latest_ready is not None and num <= latest_ready):
+                continue
+            latest_ready = num
         if latest_ready is None and max_found is None:
             return EpisodeCheckResult(
                 None, None, error="Nie znaleziono nagłówków odcinków."
@@ -332,12 +421,14 @@ def open_sheet(gc: gspread.Client, spreadsheet_title: str, worksheet_title: str)
 
 
 def map_headers(header_row: List[str]) -> Dict[str, int]:
-    normalized = [str(h or "").strip().lower() for h in header_row]
+    idx_of: Dict[str, int] = {}
+    for i, h in enumerate(header_row):
+        idx_of.setdefault(str(h or "").strip().lower(), i)
     mapping: Dict[str, int] = {}
     for canon, aliases in COLUMN_ALIASES.items():
         for a in aliases:
-            if a in normalized:
-                mapping[canon] = normalized.index(a)
+            if a in idx_of:
+                mapping[canon] = idx_of[a]
                 break
     missing = [
         k
@@ -356,22 +447,33 @@ def map_headers(header_row: List[str]) -> Dict[str, int]:
 
 
 def read_series(ws) -> Tuple[List[SeriesRow], List[str], Dict[str, int]]:
-    values = ws.get_all_values()
-    if not values:
+    header = ws.row_values(1)
+    if not header:
         raise RuntimeError("Arkusz jest pusty.")
-    header = values[0]
     mapping = map_headers(header)
+    # Pobieramy tylko kolumny potrzebne do mapowania i z wartościami
+    # nieformatowanymi, żeby liczby przychodziły od razu jako int.
+    first_col = min(mapping.values())
+    last_col = max(mapping.values())
+    data_range = "{}:{}".format(
+        gspread.utils.rowcol_to_a1(2, first_col + 1),
+        gspread.utils.rowcol_to_a1(1, last_col + 1).rstrip("0123456789"),
+    )
+    values = ws.batch_get(
+        [data_range], value_render_option=gspread.utils.ValueRenderOption.unformatted
+    )[0]
     rows: List[SeriesRow] = []
-    for i, row in enumerate(values[1:], start=2):
+    for i, row in enumerate(values, start=2):
 
-        def get(idx: int) -> str:
+        def get(idx: int) -> object:
+            idx -= first_col
             return row[idx] if idx < len(row) else ""
 
         rows.append(
             SeriesRow(
                 row_idx=i,
-                nazwa=get(mapping["nazwa"]),
-                link=get(mapping["link"]),
+                nazwa=str(get(mapping["nazwa"])),
+                link=str(get(mapping["link"])),
                 obejrzany_odcinek=parse_int(get(mapping["obejrzany_odcinek"]), 0),
                 odcinek_na_stronie=parse_int(get(mapping["odcinek_na_stronie"]), 0),
                 liczba_odcinków=parse_int(get(mapping["liczba_odcinków"]), 0),
@@ -380,8 +482,16 @@ def read_series(ws) -> Tuple[List[SeriesRow], List[str], Dict[str, int]]:
     return rows, header, mapping
 
 
-def update_cell(ws, row_idx: int, col_idx: int, value: object):
-    ws.update_cell(row_idx, col_idx, value)
+def cell_update(row_idx: int, col_idx: int, value: object) -> dict:
+    return {
+        "range": gspread.utils.rowcol_to_a1(row_idx, col_idx),
+        "values": [[value]],
+    }
+
+
+def batch_update_cells(ws, updates: List[dict]) -> None:
+    if updates:
+        ws.batch_update(updates, value_input_option="USER_ENTERED")
 
 
 def is_auth_cookie_name(name: str) -> bool:
@@ -422,6 +532,19 @@ def has_auth_cookies(session: requests.Session) -> bool:
 def build_requests_session() -> requests.Session:
     s = requests.Session()
     s.headers.update({"User-Agent": DEFAULT_USER_AGENT})
+    # Pula połączeń musi pomieścić wszystkie wątki pobierające naraz,
+    # inaczej połączenia TLS są zamykane i nawiązywane od nowa.
+    adapter = HTTPAdapter(
+        pool_maxsize=fetch_max_workers(),
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=HTTP_RETRY_STATUSES,
+            raise_on_status=False,
+        ),
+    )
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
     php_sessid = os.environ.get("PHPSESSID")
     if php_sessid:
         s.cookies.set("PHPSESSID", php_sessid, domain="www.dramaqueen.pl")
@@ -436,13 +559,38 @@ def build_requests_session() -> requests.Session:
     return s
 
 
-def response_requires_auth(resp: requests.Response) -> bool:
+def read_page_text(resp: requests.Response, limit: int = MAX_PAGE_BYTES) -> str:
+    body = bytearray()
+    for chunk in resp.iter_content(chunk_size=PAGE_CHUNK_SIZE):
+        body += chunk
+        if len(body) > limit:
+            resp.close()
+            raise RuntimeError(f"strona przekracza limit {limit} bajtów")
+    try:
+        return body.decode(resp.encoding or "utf-8", errors="replace")
+    except LookupError:
+        # Nieznana nazwa kodowania w nagłówku – tak jak requests, dekodujemy stratnie.
+        return body.decode("utf-8", errors="replace")
+
+
+def fetch_page(
+    session: requests.Session, url: str, headers: Optional[Dict[str, str]] = None
+) -> Tuple[requests.Response, str]:
+    # Treść czytamy strumieniowo z limitem, żeby nietypowo duża albo
+    # niekończąca się odpowiedź nie trafiła w całości do pamięci.
+    resp = session.get(url, timeout=60, headers=headers, stream=True)
+    return resp, read_page_text(resp)
+
+
+def response_requires_auth(resp: requests.Response, text: Optional[str] = None) -> bool:
     if resp.status_code in (401, 403):
         return True
     url = (resp.url or "").lower()
     if "wp-login.php" in url:
         return True
-    text = (resp.text or "").lower()
+    if text is None:
+        text = resp.text
+    text = (text or "").lower()
     markers = [
         'name="log"',
         "name='log'",
@@ -455,55 +603,93 @@ def response_requires_auth(resp: requests.Response) -> bool:
     return sum(marker in text for marker in markers) >= 2
 
 
+def load_http_cache(path: str) -> Dict[str, dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning("Nie udało się wczytać cache HTTP %s: %s", path, e)
+        return {}
+
+
+def save_http_cache(path: str, cache: Dict[str, dict]) -> None:
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        logger.warning("Nie udało się zapisać cache HTTP %s: %s", path, e)
+
+
+def cached_entry(http_cache: Optional[Dict[str, dict]], url: str) -> Optional[dict]:
+    if http_cache is None:
+        return None
+    cached = http_cache.get(url)
+    if not cached or cached.get("version") != HTTP_CACHE_VERSION:
+        return None
+    return cached
+
+
+def conditional_headers(cached: Optional[dict]) -> Dict[str, str]:
+    headers: Dict[str, str] = {}
+    if not cached:
+        return headers
+    if cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+    return headers
+
+
+def page_digest(html_text: str) -> str:
+    return hashlib.blake2b(html_text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def remember_response(
+    http_cache: Dict[str, dict],
+    url: str,
+    resp: requests.Response,
+    digest: str,
+    result: EpisodeCheckResult,
+) -> None:
+    if result.error:
+        return
+    http_cache[url] = {
+        "version": HTTP_CACHE_VERSION,
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "digest": digest,
+        "latest_ready": result.latest_ready,
+        "max_found": result.max_found,
+    }
+
+
 def check_series(
     session: requests.Session,
     series: SeriesRow,
     authenticator: Optional[DramaQueenAuthenticator] = None,
+    http_cache: Optional[Dict[str, dict]] = None,
 ) -> EpisodeCheckResult:
     try:
-        resp = session.get(series.link, timeout=60)
-        if response_requires_auth(resp):
+        cached = cached_entry(http_cache, series.link)
+        seen_generation = auth_generation
+        resp, text = fetch_page(session, series.link, conditional_headers(cached))
+        if resp.status_code == 304 and cached:
+            logger.debug("%s: strona bez zmian (304), używam wyniku z cache", series.nazwa)
+            return EpisodeCheckResult(cached.get("latest_ready"), cached.get("max_found"))
+        if response_requires_auth(resp, text):
             if authenticator is None:
                 return EpisodeCheckResult(
                     None,
                     None,
                     error=f"{series.nazwa}: sesja wygasła, brak skonfigurowanego automatycznego logowania",
                 )
-            recovered = False
-            last_auth_error: Optional[Exception] = None
-            for attempt in range(1, AUTH_RECOVERY_MAX_ATTEMPTS + 1):
-                logger.warning(
-                    "%s: próba odzyskania sesji %d/%d",
-                    series.nazwa,
-                    attempt,
-                    AUTH_RECOVERY_MAX_ATTEMPTS,
-                )
-                try:
-                    authenticator.ensure_session(session, force=True)
-                    last_auth_error = None
-                except Exception as auth_exc:
-                    last_auth_error = auth_exc
-                    logger.warning(
-                        "%s: nieudana próba odzyskania sesji %d/%d: %s",
-                        series.nazwa,
-                        attempt,
-                        AUTH_RECOVERY_MAX_ATTEMPTS,
-                        auth_exc,
-                    )
-                    continue
-
-                resp = session.get(series.link, timeout=60)
-                if not response_requires_auth(resp):
-                    recovered = True
-                    break
-
-                logger.warning(
-                    "%s: po próbie odzyskania sesji %d/%d strona nadal wymaga logowania",
-                    series.nazwa,
-                    attempt,
-                    AUTH_RECOVERY_MAX_ATTEMPTS,
+            with AUTH_RECOVERY_LOCK:
+                page, recovered, last_auth_error = recover_session(
+                    session, series, authenticator, seen_generation
                 )
-
             if not recovered:
                 if last_auth_error is not None:
                     return EpisodeCheckResult(
@@ -514,24 +700,175 @@ def check_series(
                     None,
                     error=f"{series.nazwa}: nie udało się odzyskać zalogowanej sesji",
                 )
+            resp, text = page
         if resp.status_code != 200:
             return EpisodeCheckResult(
                 None, None, error=f"{series.nazwa}: HTTP {resp.status_code}"
             )
-        return find_episodes(resp.text)
+        if http_cache is None:
+            return find_episodes(text)
+        # Nie każda strona zwraca ETag/Last-Modified, więc niezmienioną treść
+        # rozpoznajemy też po skrócie i pomijamy wtedy parsowanie.
+        digest = page_digest(text)
+        if cached and cached.get("digest") == digest:
+            logger.debug("%s: treść strony bez zmian, używam wyniku z cache", series.nazwa)
+            return EpisodeCheckResult(cached.get("latest_ready"), cached.get("max_found"))
+        result = find_episodes(text)
+        remember_response(http_cache, series.link, resp, digest, result)
+        return result
     except Exception as e:
         return EpisodeCheckResult(
             None, None, error=f"{series.nazwa}: błąd pobierania: {e}"
         )
 
 
-def send_email(subject: str, html_body: str, email_to: str) -> None:
+def recover_session(
+    session: requests.Session,
+    series: SeriesRow,
+    authenticator: DramaQueenAuthenticator,
+    seen_generation: Optional[int] = None,
+) -> Tuple[Optional[Tuple[requests.Response, str]], bool, Optional[Exception]]:
+    global auth_generation
+    page: Optional[Tuple[requests.Response, str]] = None
+    recovered = False
+    last_auth_error: Optional[Exception] = None
+    if seen_generation is not None and seen_generation != auth_generation:
+        page = fetch_page(session, series.link)
+        if not response_requires_auth(*page):
+            return page, True, None
+    for attempt in range(1, AUTH_RECOVERY_MAX_ATTEMPTS + 1):
+        logger.warning(
+            "%s: próba odzyskania sesji %d/%d",
+            series.nazwa,
+            attempt,
+            AUTH_RECOVERY_MAX_ATTEMPTS,
+        )
+        try:
+            authenticator.ensure_session(session, force=True)
+            auth_generation += 1
+            last_auth_error = None
+        except Exception as auth_exc:
+            last_auth_error = auth_exc
+            logger.warning(
+                "%s: nieudana próba odzyskania sesji %d/%d: %s",
+                series.nazwa,
+                attempt,
+                AUTH_RECOVERY_MAX_ATTEMPTS,
+                auth_exc,
+            )
+            continue
+
+        page = fetch_page(session, series.link)
+        if not response_requires_auth(*page):
+            recovered = True
+            break
+
+        logger.warning(
+            "%s: po próbie odzyskania sesji %d/%d strona nadal wymaga logowania",
+            series.nazwa,
+            attempt,
+            AUTH_RECOVERY_MAX_ATTEMPTS,
+        )
+    return page, recovered, last_auth_error
+
+
+def fetch_all(
+    session: requests.Session,
+    rows: List[SeriesRow],
+    authenticator: Optional[DramaQueenAuthenticator] = None,
+    http_cache: Optional[Dict[str, dict]] = None,
+) -> List[Tuple[SeriesRow, EpisodeCheckResult]]:
+    if not rows:
+        return []
+    # Kilka wierszy może wskazywać ten sam serial – każdą stronę pobieramy raz.
+    unique_rows: Dict[str, SeriesRow] = {}
+    for s in rows:
+        unique_rows.setdefault(s.link, s)
+    targets = list(unique_rows.values())
+    # Pierwszy serial sprawdzamy sam, żeby ewentualne logowanie odbyło się raz,
+    # zanim równoległe żądania trafią na stronę logowania.
+    results: Dict[str, EpisodeCheckResult] = {
+        targets[0].link: check_series(session, targets[0], authenticator, http_cache)
+    }
+    with ThreadPoolExecutor(max_workers=fetch_max_workers()) as executor:
+        rest = executor.map(
+            lambda s: check_series(session, s, authenticator, http_cache),
+            targets[1:],
+        )
+        results.update(zip((s.link for s in targets[1:]), rest))
+    return [(s, results[s.link]) for s in rows]
+
+
+def connect_smtp() -> smtplib.SMTP:
     smtp_host = os.environ.get("SMTP_HOST", "smtp.gmail.com")
     smtp_port = int(os.environ.get("SMTP_PORT", "587"))
+    smtp_user = os.environ.get("SMTP_USER")
+    smtp_pass = os.environ.get("SMTP_PASS")
+    if not (smtp_user and smtp_pass):
+        raise RuntimeError("Brak ustawień SMTP")
+
+    server = smtplib.SMTP(smtp_host, smtp_port, timeout=60)
+    try:
+        server.ehlo()
+        if smtp_port == 587:
+            server.starttls()
+            server.ehlo()
+        server.login(smtp_user, smtp_pass)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
+def start_smtp_login() -> Future:
+    # Połączenie, STARTTLS i logowanie trwają kilka RTT, więc wykonujemy je
+    # w tle równolegle z pobieraniem stron seriali.
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(connect_smtp)
+    executor.shutdown(wait=False)
+    return future
+
+
+def take_smtp_connection(smtp_login: Optional[Future]) -> Optional[smtplib.SMTP]:
+    if smtp_login is None:
+        return None
+    try:
+        return smtp_login.result()
+    except Exception as e:
+        logger.warning("Nie udało się wcześniej połączyć z SMTP: %s", e)
+        return None
+
+
+def smtp_connection_alive(server: smtplib.SMTP) -> bool:
+    # Połączenie czeka bezczynnie przez całe pobieranie stron, więc serwer mógł
+    # je w tym czasie zamknąć (np. odpowiedzią 421).
+    try:
+        code, _ = server.noop()
+    except (smtplib.SMTPException, OSError):
+        return False
+    return code == 250
+
+
+def close_smtp(server: Optional[smtplib.SMTP]) -> None:
+    if server is None:
+        return
+    try:
+        server.quit()
+    except Exception:
+        server.close()
+
+
+def send_email(
+    subject: str,
+    html_body: str,
+    email_to: str,
+    server: Optional[smtplib.SMTP] = None,
+) -> None:
     smtp_user = os.environ.get("SMTP_USER")
     smtp_pass = os.environ.get("SMTP_PASS")
     email_from = os.environ.get("EMAIL_FROM", smtp_user)
     if not (smtp_user and smtp_pass and email_to):
+        close_smtp(server)
         raise RuntimeError("Brak ustawień SMTP/EMAIL_TO")
 
     msg = EmailMessage()
@@ -540,12 +877,13 @@ def send_email(subject: str, html_body: str, email_to: str) -> None:
     msg["Subject"] = subject
     msg.add_alternative(html_body, subtype="html")
 
-    with smtplib.SMTP(smtp_host, smtp_port, timeout=60) as server:
-        server.ehlo()
-        if smtp_port == 587:
-            server.starttls()
-            server.ehlo()
-        server.login(smtp_user, smtp_pass)
+    if server is not None and not smtp_connection_alive(server):
+        logger.warning("Przygotowane połączenie SMTP nie jest już aktywne, łączę ponownie.")
+        close_smtp(server)
+        server = None
+    if server is None:
+        server = connect_smtp()
+    with server:
         server.send_message(msg)
         logger.info("Wysłano e-mail HTML do %s", email_to)
 
@@ -592,6 +930,7 @@ def process_user(
     cfg: UserConfig,
     session: requests.Session,
     authenticator: Optional[DramaQueenAuthenticator] = None,
+    http_cache: Optional[Dict[str, dict]] = None,
 ) -> int:
     try:
         gc = authenticate_gspread(cfg.service_account_file)
@@ -610,61 +949,86 @@ def process_user(
             pass
         return 2
 
-    new_items: List[dict] = []
-    problems: List[str] = []
-
-    for s in rows:
-        if s.is_done:
-            continue
-        if not s.link:
-            problems.append(f"{s.nazwa}: brak linku w arkuszu")
-            continue
-        result = check_series(session, s, authenticator)
-        if result.error:
-            problems.append(result.error)
-            continue
-
-        latest_ready = result.latest_ready or 0
-        max_found = result.max_found or 0
+    # Bez always_send nie wiadomo jeszcze, czy e-mail w ogóle zostanie wysłany.
+    smtp_login = start_smtp_login() if cfg.always_send else None
+    try:
+        new_items: List[NewItem] = []
+        problems: List[str] = []
+        pending_updates: List[dict] = []
+        checked_rows: List[Tuple[SeriesRow, int, int]] = []
+
+        active_rows: List[SeriesRow] = []
+        for s in rows:
+            if s.is_done:
+                continue
+            if not s.link:
+                problems.append(f"{s.nazwa}: brak linku w arkuszu")
+                continue
+            active_rows.append(s)
+
+        col_site = mapping["odcinek_na_stronie"] + 1
+        col_total = mapping["liczba_odcinków"] + 1
+        failed_links = set()
+        for s, result in fetch_all(session, active_rows, authenticator, http_cache):
+            if result.error:
+                # Wiersze z tym samym linkiem dzielą wynik – błąd zgłaszamy raz.
+                if s.link not in failed_links:
+                    failed_links.add(s.link)
+                    problems.append(result.error)
+                continue
+
+            latest_ready = result.latest_ready or 0
+            max_found = result.max_found or 0
 
-        try:
             if latest_ready > s.odcinek_na_stronie:
-                update_cell(
-                    ws, s.row_idx, mapping["odcinek_na_stronie"] + 1, latest_ready
-                )
-                s.odcinek_na_stronie = latest_ready
-        except APIError as e:
-            problems.append(f"{s.nazwa}: błąd aktualizacji arkusza: {e}")
+                pending_updates.append(cell_update(s.row_idx, col_site, latest_ready))
+            if max_found > s.liczba_odcinków:
+                pending_updates.append(cell_update(s.row_idx, col_total, max_found))
+            checked_rows.append((s, latest_ready, max_found))
 
+        # Wiersze zmieniamy dopiero po udanym zapisie, żeby e-mail nie ogłaszał
+        # odcinków, których arkusz nie zapamiętał.
         try:
-            if max_found > s.liczba_odcinków:
-                update_cell(ws, s.row_idx, mapping["liczba_odcinków"] + 1, max_found)
-                s.liczba_odcinków = max_found
+            batch_update_cells(ws, pending_updates)
+            updates_saved = True
         except APIError as e:
-            problems.append(f"{s.nazwa}: błąd aktualizacji liczby odcinków: {e}")
-
-        if s.obejrzany_odcinek < s.odcinek_na_stronie:
-            new_items.append(
-                {
-                    "tytuł": s.nazwa,
-                    "nowy_odcinek": s.odcinek_na_stronie,
-                    "ostatni_obejrzany": s.obejrzany_odcinek,
-                    "liczba_odcinków": s.liczba_odcinków,
-                    "link": s.link,
-                }
-            )
-
-    subject = "Nowe odcinki do obejrzenia – Sprawdzacz"
-    html_body = build_email_html(new_items, problems)
+            updates_saved = False
+            problems.append(f"Błąd aktualizacji arkusza, nowe odcinki nie zostały zapisane: {e}")
+
+        for s, latest_ready, max_found in checked_rows:
+            if updates_saved:
+                s.odcinek_na_stronie = max(s.odcinek_na_stronie, latest_ready)
+                s.liczba_odcinków = max(s.liczba_odcinków, max_found)
+            if s.obejrzany_odcinek < s.odcinek_na_stronie:
+                new_items.append(
+                    NewItem(
+                        tytul=s.nazwa,
+                        nowy_odcinek=s.odcinek_na_stronie,
+                        ostatni_obejrzany=s.obejrzany_odcinek,
+                        liczba_odcinkow=s.liczba_odcinków,
+                        link=s.link,
+                    )
+                )
 
-    if cfg.always_send or new_items or problems:
-        try:
-            send_email(subject, html_body, cfg.email_to)
-        except Exception as e:
-            logger.exception("[%s] Błąd wysyłki e-mail: %s", cfg.email_to, e)
-            return 3
-    else:
-        logger.info("[%s] Brak zmian – e-mail nie został wysłany.", cfg.email_to)
+        subject = "Nowe odcinki do obejrzenia – Sprawdzacz"
+        html_body = build_email_html(new_items, problems)
+
+        smtp_server = take_smtp_connection(smtp_login)
+        # Od tej chwili połączeniem zarządza send_email() albo close_smtp() poniżej.
+        smtp_login = None
+        if cfg.always_send or new_items or problems:
+            try:
+                send_email(subject, html_body, cfg.email_to, smtp_server)
+            except Exception as e:
+                logger.exception("[%s] Błąd wysyłki e-mail: %s", cfg.email_to, e)
+                return 3
+        else:
+            close_smtp(smtp_server)
+            logger.info("[%s] Brak zmian – e-mail nie został wysłany.", cfg.email_to)
+    finally:
+        # Wyjątek przed wysyłką nie może zostawić otwartego połączenia SMTP.
+        if smtp_login is not None:
+            close_smtp(take_smtp_connection(smtp_login))
 
     return 0
 
@@ -675,9 +1039,16 @@ def main() -> int:
     auth_config = build_auth_config()
     authenticator = DramaQueenAuthenticator(auth_config) if auth_config.is_configured else None
     configs = load_user_configs()
+    http_cache_file = os.environ.get("HTTP_CACHE_FILE", DEFAULT_HTTP_CACHE_FILE)
+    http_cache = load_http_cache(http_cache_file)
     exit_code = 0
-    for cfg in configs:
-        exit_code = max(exit_code, process_user(cfg, session, authenticator))
+    try:
+        for cfg in configs:
+            exit_code = max(
+                exit_code, process_user(cfg, session, authenticator, http_cache)
+            )
+    finally:
+        save_http_cache(http_cache_file, http_cache)
     logger.info("Zakończono.")
     return exit_code
 
@@ -1,3 +1,6 @@
+import os
+import smtplib
+import time
 import unittest
 
 import requests
@@ -6,10 +9,20 @@ import main
 
 
 class FakeResponse:
-    def __init__(self, status_code=200, url="https://www.dramaqueen.pl/serial", text=""):
+    def __init__(self, status_code=200, url="https://www.dramaqueen.pl/serial", text="", headers=None):
         self.status_code = status_code
         self.url = url
         self.text = text
+        self.headers = headers or {}
+        self.encoding = "utf-8"
+
+    def iter_content(self, chunk_size=1):
+        body = self.text.encode("utf-8")
+        for start in range(0, len(body), chunk_size):
+            yield body[start : start + chunk_size]
+
+    def close(self):
+        pass
 
 
 class FakeSession:
@@ -17,12 +30,73 @@ class FakeSession:
         self._responses = list(responses)
         self.cookies = requests.Session().cookies
 
-    def get(self, url, timeout=60):
+    def get(self, url, timeout=60, headers=None, stream=False):
         if not self._responses:
             raise AssertionError("Brak przygotowanej odpowiedzi dla FakeSession.")
         return self._responses.pop(0)
 
 
+class RecordingFakeSession(FakeSession):
+    def __init__(self, responses):
+        super().__init__(responses)
+        self.sent_headers = []
+
+    def get(self, url, timeout=60, headers=None, stream=False):
+        self.sent_headers.append(headers or {})
+        return super().get(url, timeout=timeout, headers=headers, stream=stream)
+
+
+class UrlFakeSession:
+    def __init__(self, pages):
+        self._pages = dict(pages)
+        self.cookies = requests.Session().cookies
+        self.requested_urls = []
+
+    def get(self, url, timeout=60, headers=None, stream=False):
+        self.requested_urls.append(url)
+        return FakeResponse(url=url, text=self._pages[url])
+
+
+class FakeSmtpServer:
+    def __init__(self, noop_code=250):
+        self.noop_code = noop_code
+        self.sent = []
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def noop(self):
+        return self.noop_code, b"ok"
+
+    def quit(self):
+        self.closed = True
+
+    def send_message(self, msg):
+        self.sent.append(msg)
+
+
+class AuthGatedFakeSession:
+    def __init__(self, public_url, protected_urls):
+        self.public_url = public_url
+        self.protected_urls = set(protected_urls)
+        self.cookies = requests.Session().cookies
+
+    def get(self, url, timeout=60, headers=None, stream=False):
+        if url in self.protected_urls and not main.has_auth_cookies(self):
+            # Opóźnienie sprawia, że wszystkie wątki dostają stronę logowania,
+            # zanim którykolwiek z nich zdąży się zalogować.
+            time.sleep(0.05)
+            return FakeResponse(
+                url="https://www.dramaqueen.pl/wp-login.php",
+                text='<input id="user_login" name="log"><input id="user_pass" name="pwd">',
+            )
+        return FakeResponse(url=url, text='<p class="toggler">Odcinek 2</p>')
+
+
 class FakeAuthenticator:
     def __init__(self):
         self.calls = 0
@@ -59,6 +133,16 @@ class AuthSessionTests(unittest.TestCase):
         self.assertIsNone(main.extract_episode_number("Odcinek 6 - wkrótce"))
         self.assertIsNone(main.extract_episode_number("Odcinek 10 - Final"))
 
+    def test_parse_int_handles_plain_digits_and_mixed_content(self):
+        self.assertEqual(12, main.parse_int("12"))
+        self.assertEqual(7, main.parse_int(" 7 "))
+        self.assertEqual(1220, main.parse_int("12 / 20"))
+        self.assertEqual(1220, main.parse_int("Odcinek 12 – 20"))
+        self.assertEqual(3, main.parse_int(3.0))
+        self.assertEqual(5, main.parse_int("", 5))
+        self.assertEqual(5, main.parse_int(None, 5))
+        self.assertEqual(5, main.parse_int("brak", 5))
+
     def test_find_episodes_ignores_labels_with_additional_description(self):
         html = """
         <p class="toggler">Odcinek 5</p>
@@ -108,6 +192,109 @@ class AuthSessionTests(unittest.TestCase):
         self.assertEqual(9, result.latest_ready)
         self.assertEqual(10, result.max_found)
 
+    def test_find_episodes_reads_nested_markup_and_entities(self):
+        html = """
+        <p class='toggler open'><strong>Odcinek</strong>&nbsp;11</p>
+        <p id="ep12" class="entry toggler"><span><img src="locked.png"></span>Odcinek 12 &ndash; Finał</p>
+        """
+
+        result = main.find_episodes(html)
+
+        self.assertIsNone(result.error)
+        self.assertEqual(11, result.latest_ready)
+        self.assertEqual(12, result.max_found)
+
+    def test_find_episodes_does_not_merge_unclosed_toggler_with_next_one(self):
+        html = """
+        <p class="toggler">Odcinek 3<p class="toggler"><img src="locked.png">Odcinek 4</p>
+        <p class="toggler">Odcinek 5
+        """
+
+        result = main.find_episodes(html)
+
+        self.assertEqual(
+            [("Odcinek 3", False), ("Odcinek 4", True), ("Odcinek 5", False)],
+            [(text.strip(), has_img) for text, has_img in main.extract_togglers(html)],
+        )
+        self.assertIsNone(result.error)
+        self.assertEqual(5, result.latest_ready)
+        self.assertEqual(5, result.max_found)
+
+    def test_find_episodes_reads_unclosed_paragraphs_inside_block(self):
+        html = """
+        <div><p class="toggler">Odcinek 3<p class="toggler"><img src="locked.png">Odcinek 4</div>
+        """
+
+        result = main.find_episodes(html)
+
+        self.assertIsNone(result.error)
+        self.assertEqual(3, result.latest_ready)
+        self.assertEqual(4, result.max_found)
+
+    def test_find_episodes_ignores_togglers_in_comments_and_scripts(self):
+        html = """
+        <!-- <p class="toggler">Odcinek 99</p> -->
+        <script>var tpl = '<p class="toggler">Odcinek 98</p>';</script>
+        <template><p class="toggler">Odcinek 97</p></template>
+        <p class="toggler">Odcinek 3</p>
+        """
+
+        result = main.find_episodes(html)
+
+        self.assertIsNone(result.error)
+        self.assertEqual(3, result.latest_ready)
+        self.assertEqual(3, result.max_found)
+
+    def test_find_episodes_matches_toggler_class_case_sensitively(self):
+        html = '<P CLASS="Toggler">Odcinek 9</P><P CLASS="toggler">Odcinek 2</P>'
+
+        result = main.find_episodes(html)
+
+        self.assertIsNone(result.error)
+        self.assertEqual(2, result.latest_ready)
+        self.assertEqual(2, result.max_found)
+
+    def test_find_episodes_falls_back_to_lxml_for_unquoted_class(self):
+        html = """
+        <div><p class=toggler>Odcinek 3</p><p class=toggler><img src="locked.png">Odcinek 4</p></div>
+        """
+
+        self.assertEqual([], main.extract_togglers(html))
+        result = main.find_episodes(html)
+
+        self.assertIsNone(result.error)
+        self.assertEqual(3, result.latest_ready)
+        self.assertEqual(4, result.max_found)
+
+    def test_extract_togglers_with_lxml_keeps_nested_text_while_freeing_tree(self):
+        html = """
+        <div><p class=toggler><span>Odcinek</span> 3</p></div>
+        <div><p class=toggler><b>Odcinek</b> 4<img src="locked.png"></p></div>
+        """
+
+        self.assertEqual(
+            [("Odcinek 3", False), ("Odcinek 4", True)],
+            main.extract_togglers_with_lxml(html),
+        )
+
+    def test_build_email_html_escapes_titles_and_problems(self):
+        html_body = main.build_email_html(
+            [
+                main.NewItem(
+                    tytul="Tom & Jerry",
+                    nowy_odcinek=3,
+                    ostatni_obejrzany=2,
+                    liczba_odcinkow=16,
+                    link="https://www.dramaqueen.pl/tom-jerry",
+                )
+            ],
+            ["<script>alert(1)</script>"],
+        )
+
+        self.assertIn("Tom &amp; Jerry", html_body)
+        self.assertIn("&lt;script&gt;", html_body)
+        self.assertNotIn("<script>", html_body)
+
     def test_extract_auth_cookies_filters_only_session_cookies(self):
         cookies = [
             {"name": "PHPSESSID", "value": "abc"},
@@ -137,6 +324,30 @@ class AuthSessionTests(unittest.TestCase):
             [cookie["name"] for cookie in filtered],
         )
 
+    def test_build_requests_session_mounts_pooled_adapter_with_retry(self):
+        session = main.build_requests_session()
+
+        adapter = session.get_adapter("https://www.dramaqueen.pl/serial")
+
+        self.assertEqual(
+            main.DEFAULT_FETCH_MAX_WORKERS, adapter.poolmanager.connection_pool_kw["maxsize"]
+        )
+        self.assertEqual(3, adapter.max_retries.total)
+        self.assertIn(503, adapter.max_retries.status_forcelist)
+
+    def test_read_page_text_stops_when_body_exceeds_limit(self):
+        response = FakeResponse(text="Odcinek 1 " * 100)
+
+        self.assertEqual("Odcinek 1 " * 100, main.read_page_text(response, limit=1000))
+        with self.assertRaises(RuntimeError):
+            main.read_page_text(response, limit=999)
+
+    def test_read_page_text_falls_back_to_utf8_for_unknown_charset(self):
+        response = FakeResponse(text="Odcinek 10 - Finał")
+        response.encoding = "x-unknown-charset"
+
+        self.assertEqual("Odcinek 10 - Finał", main.read_page_text(response))
+
     def test_response_requires_auth_detects_wordpress_login_form(self):
         response = FakeResponse(
             url="https://www.dramaqueen.pl/serial",
@@ -275,6 +486,183 @@ class AuthSessionTests(unittest.TestCase):
         self.assertIn("nie udało się odzyskać zalogowanej sesji", result.error or "")
         self.assertEqual(main.AUTH_RECOVERY_MAX_ATTEMPTS, authenticator.calls)
 
+    def test_fetch_all_returns_results_in_row_order(self):
+        pages = {
+            f"https://www.dramaqueen.pl/drama-{i}": f'<p class="toggler">Odcinek {i}</p>'
+            for i in range(1, 6)
+        }
+        session = UrlFakeSession(pages)
+        rows = [
+            main.SeriesRow(
+                row_idx=i + 1,
+                nazwa=f"Drama {i}",
+                link=f"https://www.dramaqueen.pl/drama-{i}",
+                obejrzany_odcinek=0,
+                odcinek_na_stronie=0,
+                liczba_odcinków=16,
+            )
+            for i in range(1, 6)
+        ]
+
+        results = main.fetch_all(session, rows)
+
+        self.assertEqual(rows, [row for row, _ in results])
+        self.assertEqual([1, 2, 3, 4, 5], [result.latest_ready for _, result in results])
+
+    def test_fetch_all_logs_in_once_when_many_rows_need_auth(self):
+        protected = [f"https://www.dramaqueen.pl/protected-{i}" for i in range(8)]
+        session = AuthGatedFakeSession("https://www.dramaqueen.pl/public", protected)
+        authenticator = FakeAuthenticator()
+        rows = [
+            main.SeriesRow(
+                row_idx=i + 2,
+                nazwa=f"Drama {i}",
+                link=link,
+                obejrzany_odcinek=0,
+                odcinek_na_stronie=0,
+                liczba_odcinków=16,
+            )
+            for i, link in enumerate(["https://www.dramaqueen.pl/public", *protected])
+        ]
+
+        results = main.fetch_all(session, rows, authenticator)
+
+        self.assertEqual(1, authenticator.calls)
+        self.assertEqual([None] * 9, [result.error for _, result in results])
+        self.assertEqual([2] * 9, [result.latest_ready for _, result in results])
+
+    def test_fetch_all_requests_each_link_once(self):
+        session = UrlFakeSession(
+            {"https://www.dramaqueen.pl/shared": '<p class="toggler">Odcinek 8</p>'}
+        )
+        rows = [
+            main.SeriesRow(
+                row_idx=i,
+                nazwa=f"Drama {i}",
+                link="https://www.dramaqueen.pl/shared",
+                obejrzany_odcinek=0,
+                odcinek_na_stronie=0,
+                liczba_odcinków=16,
+            )
+            for i in (2, 3, 4)
+        ]
+
+        results = main.fetch_all(session, rows)
+
+        self.assertEqual(["https://www.dramaqueen.pl/shared"], session.requested_urls)
+        self.assertEqual(rows, [row for row, _ in results])
+        self.assertEqual([8, 8, 8], [result.latest_ready for _, result in results])
+
+    def test_check_series_reuses_cached_result_on_not_modified(self):
+        episode_page = FakeResponse(
+            text='<p class="toggler">Odcinek 3</p><p class="toggler"><img src="x.png">Odcinek 4</p>',
+            headers={"ETag": '"abc"', "Last-Modified": "Wed, 14 Oct 2026 10:00:00 GMT"},
+        )
+        not_modified = FakeResponse(status_code=304)
+        session = RecordingFakeSession([episode_page, not_modified])
+        series = main.SeriesRow(
+            row_idx=2,
+            nazwa="Test Drama",
+            link="https://www.dramaqueen.pl/test-drama",
+            obejrzany_odcinek=1,
+            odcinek_na_stronie=1,
+            liczba_odcinków=12,
+        )
+        http_cache = {}
+
+        first = main.check_series(session, series, http_cache=http_cache)
+        second = main.check_series(session, series, http_cache=http_cache)
+
+        self.assertEqual({}, session.sent_headers[0])
+        self.assertEqual('"abc"', session.sent_headers[1]["If-None-Match"])
+        self.assertEqual(
+            "Wed, 14 Oct 2026 10:00:00 GMT", session.sent_headers[1]["If-Modified-Since"]
+        )
+        self.assertEqual((3, 4), (first.latest_ready, first.max_found))
+        self.assertIsNone(second.error)
+        self.assertEqual((3, 4), (second.latest_ready, second.max_found))
+
+    def test_send_email_uses_prepared_connection_and_reconnects_when_closed(self):
+        original_env = dict(os.environ)
+        original_connect_smtp = main.connect_smtp
+        try:
+            os.environ.update({"SMTP_USER": "user", "SMTP_PASS": "secret"})
+            fresh = FakeSmtpServer()
+            main.connect_smtp = lambda: fresh
+
+            prepared = FakeSmtpServer()
+            main.send_email("Temat", "<p>x</p>", "example@example.com", prepared)
+            stale = FakeSmtpServer(noop_code=421)
+            main.send_email("Temat", "<p>x</p>", "example@example.com", stale)
+
+            self.assertEqual(1, len(prepared.sent))
+            self.assertEqual([], stale.sent)
+            self.assertTrue(stale.closed)
+            self.assertEqual(1, len(fresh.sent))
+            self.assertEqual("example@example.com", fresh.sent[0]["To"])
+        finally:
+            os.environ.clear()
+            os.environ.update(original_env)
+            main.connect_smtp = original_connect_smtp
+
+    def test_check_series_ignores_cache_entries_from_other_parser_version(self):
+        page_text = '<p class="toggler">Odcinek 6</p>'
+        session = RecordingFakeSession([FakeResponse(text=page_text)])
+        series = main.SeriesRow(
+            row_idx=2,
+            nazwa="Test Drama",
+            link="https://www.dramaqueen.pl/test-drama",
+            obejrzany_odcinek=1,
+            odcinek_na_stronie=1,
+            liczba_odcinków=12,
+        )
+        http_cache = {
+            series.link: {
+                "version": main.HTTP_CACHE_VERSION - 1,
+                "etag": '"old"',
+                "last_modified": None,
+                "digest": main.page_digest(page_text),
+                "latest_ready": 5,
+                "max_found": 5,
+            }
+        }
+
+        result = main.check_series(session, series, http_cache=http_cache)
+
+        self.assertEqual({}, session.sent_headers[0])
+        self.assertEqual((6, 6), (result.latest_ready, result.max_found))
+        self.assertEqual(main.HTTP_CACHE_VERSION, http_cache[series.link]["version"])
+
+    def test_check_series_skips_parsing_when_page_content_is_unchanged(self):
+        page_text = '<p class="toggler">Odcinek 6</p>'
+        session = FakeSession([FakeResponse(text=page_text), FakeResponse(text=page_text)])
+        series = main.SeriesRow(
+            row_idx=2,
+            nazwa="Test Drama",
+            link="https://www.dramaqueen.pl/test-drama",
+            obejrzany_odcinek=1,
+            odcinek_na_stronie=1,
+            liczba_odcinków=12,
+        )
+        http_cache = {}
+        parse_calls = []
+        original_find_episodes = main.find_episodes
+        try:
+            def counting_find_episodes(html_text):
+                parse_calls.append(html_text)
+                return original_find_episodes(html_text)
+
+            main.find_episodes = counting_find_episodes
+
+            first = main.check_series(session, series, http_cache=http_cache)
+            second = main.check_series(session, series, http_cache=http_cache)
+        finally:
+            main.find_episodes = original_find_episodes
+
+        self.assertEqual(1, len(parse_calls))
+        self.assertEqual(6, first.latest_ready)
+        self.assertEqual((6, 6), (second.latest_ready, second.max_found))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,15 +1,26 @@
 import unittest
 
+import gspread
 import requests
 
 import main
 
 
 class FakeResponse:
-    def __init__(self, status_code=200, url="https://www.dramaqueen.pl/serial", text=""):
+    def __init__(self, status_code=200, url="https://www.dramaqueen.pl/serial", text="", headers=None):
         self.status_code = status_code
         self.url = url
         self.text = text
+        self.headers = headers or {}
+        self.encoding = "utf-8"
+
+    def iter_content(self, chunk_size=1):
+        body = self.text.encode("utf-8")
+        for start in range(0, len(body), chunk_size):
+            yield body[start : start + chunk_size]
+
+    def close(self):
+        pass
 
 
 class FakeSession:
@@ -18,12 +29,27 @@ class FakeSession:
         self.cookies = requests.Session().cookies
         self.headers = {}
 
-    def get(self, url, timeout=60):
+    def get(self, url, timeout=60, headers=None, stream=False):
         if not self._responses:
             raise AssertionError(f"Brak przygotowanej odpowiedzi dla URL {url}.")
         return self._responses.pop(0)
 
 
+class FakeApiErrorResponse:
+    text = "quota exceeded"
+
+    def json(self):
+        return {"error": {"code": 429, "message": "Quota exceeded", "status": "RESOURCE_EXHAUSTED"}}
+
+
+class FakeSmtpConnection:
+    def __init__(self):
+        self.closed = False
+
+    def quit(self):
+        self.closed = True
+
+
 class FakeAuthenticator:
     def __init__(self):
         self.calls = 0
@@ -63,12 +89,30 @@ class FakeWorksheet:
             ],
         ]
         self.updated_cells = []
+        self.batch_calls = 0
+        self.batch_error = None
+
+    def row_values(self, row):
+        return self.values[row - 1] if row <= len(self.values) else []
+
+    def batch_get(self, ranges, value_render_option=None):
+        result = []
+        for a1_range in ranges:
+            start, end = a1_range.split(":")
+            start_row, start_col = gspread.utils.a1_to_rowcol(start)
+            _, end_col = gspread.utils.a1_to_rowcol(f"{end}1")
+            result.append(
+                [row[start_col - 1 : end_col] for row in self.values[start_row - 1 :]]
+            )
+        return result
 
-    def get_all_values(self):
-        return self.values
-
-    def update_cell(self, row_idx, col_idx, value):
-        self.updated_cells.append((row_idx, col_idx, value))
+    def batch_update(self, data, value_input_option=None):
+        self.batch_calls += 1
+        if self.batch_error is not None:
+            raise self.batch_error
+        for item in data:
+            row_idx, col_idx = gspread.utils.a1_to_rowcol(item["range"])
+            self.updated_cells.append((row_idx, col_idx, item["values"][0][0]))
 
 
 class SmokeFlowTests(unittest.TestCase):
@@ -92,14 +136,16 @@ class SmokeFlowTests(unittest.TestCase):
         original_authenticate_gspread = main.authenticate_gspread
         original_open_sheet = main.open_sheet
         original_send_email = main.send_email
+        original_connect_smtp = main.connect_smtp
         try:
+            main.connect_smtp = lambda: None
             main.authenticate_gspread = lambda service_account_file: object()
             main.open_sheet = lambda gc, spreadsheet_title, worksheet_title: (
                 object(),
                 worksheet,
             )
 
-            def fake_send_email(subject, html_body, email_to):
+            def fake_send_email(subject, html_body, email_to, server=None):
                 sent_messages.append(
                     {
                         "subject": subject,
@@ -131,6 +177,7 @@ class SmokeFlowTests(unittest.TestCase):
             main.authenticate_gspread = original_authenticate_gspread
             main.open_sheet = original_open_sheet
             main.send_email = original_send_email
+            main.connect_smtp = original_connect_smtp
 
     def test_process_user_ignores_descriptive_label_and_does_not_false_positive(self):
         login_page = FakeResponse(
@@ -156,14 +203,16 @@ class SmokeFlowTests(unittest.TestCase):
         original_authenticate_gspread = main.authenticate_gspread
         original_open_sheet = main.open_sheet
         original_send_email = main.send_email
+        original_connect_smtp = main.connect_smtp
         try:
+            main.connect_smtp = lambda: None
             main.authenticate_gspread = lambda service_account_file: object()
             main.open_sheet = lambda gc, spreadsheet_title, worksheet_title: (
                 object(),
                 worksheet,
             )
 
-            def fake_send_email(subject, html_body, email_to):
+            def fake_send_email(subject, html_body, email_to, server=None):
                 sent_messages.append(
                     {
                         "subject": subject,
@@ -182,16 +231,22 @@ class SmokeFlowTests(unittest.TestCase):
                 service_account_file="service_account.json",
             )
 
+            smtp_logins = []
+            main.connect_smtp = lambda: smtp_logins.append(1)
+
             result = main.process_user(cfg, session, authenticator)
 
             self.assertEqual(0, result)
+            self.assertEqual([], smtp_logins)
             self.assertEqual(1, authenticator.calls)
             self.assertEqual([], worksheet.updated_cells)
+            self.assertEqual(0, worksheet.batch_calls)
             self.assertEqual([], sent_messages)
         finally:
             main.authenticate_gspread = original_authenticate_gspread
             main.open_sheet = original_open_sheet
             main.send_email = original_send_email
+            main.connect_smtp = original_connect_smtp
 
     def test_process_user_accepts_climax_final_episode_label(self):
         login_page = FakeResponse(
@@ -218,14 +273,16 @@ class SmokeFlowTests(unittest.TestCase):
         original_authenticate_gspread = main.authenticate_gspread
         original_open_sheet = main.open_sheet
         original_send_email = main.send_email
+        original_connect_smtp = main.connect_smtp
         try:
+            main.connect_smtp = lambda: None
             main.authenticate_gspread = lambda service_account_file: object()
             main.open_sheet = lambda gc, spreadsheet_title, worksheet_title: (
                 object(),
                 worksheet,
             )
 
-            def fake_send_email(subject, html_body, email_to):
+            def fake_send_email(subject, html_body, email_to, server=None):
                 sent_messages.append(
                     {
                         "subject": subject,
@@ -249,6 +306,7 @@ class SmokeFlowTests(unittest.TestCase):
             self.assertEqual(0, result)
             self.assertEqual(1, authenticator.calls)
             self.assertEqual([(2, 4, 10)], worksheet.updated_cells)
+            self.assertEqual(1, worksheet.batch_calls)
             self.assertEqual(1, len(sent_messages))
             self.assertIn("Climax", sent_messages[0]["html_body"])
             self.assertIn("<strong>10</strong>", sent_messages[0]["html_body"])
@@ -256,6 +314,164 @@ class SmokeFlowTests(unittest.TestCase):
             main.authenticate_gspread = original_authenticate_gspread
             main.open_sheet = original_open_sheet
             main.send_email = original_send_email
+            main.connect_smtp = original_connect_smtp
+
+    def test_process_user_reports_shared_link_error_once(self):
+        session = FakeSession([FakeResponse(status_code=500)])
+        worksheet = FakeWorksheet()
+        worksheet.values.append(
+            [
+                "Smoke Drama (rewatch)",
+                "https://www.dramaqueen.pl/drama/koreanska/smoke-drama/",
+                "0",
+                "1",
+                "12",
+            ]
+        )
+        sent_messages = []
+
+        original_authenticate_gspread = main.authenticate_gspread
+        original_open_sheet = main.open_sheet
+        original_send_email = main.send_email
+        original_connect_smtp = main.connect_smtp
+        try:
+            main.connect_smtp = lambda: None
+            main.authenticate_gspread = lambda service_account_file: object()
+            main.open_sheet = lambda gc, spreadsheet_title, worksheet_title: (
+                object(),
+                worksheet,
+            )
+
+            def fake_send_email(subject, html_body, email_to, server=None):
+                sent_messages.append(html_body)
+
+            main.send_email = fake_send_email
+
+            cfg = main.UserConfig(
+                sheet_title="dramy",
+                worksheet_title="Arkusz1",
+                email_to="example@example.com",
+                always_send=False,
+                service_account_file="service_account.json",
+            )
+
+            result = main.process_user(cfg, session, FakeAuthenticator())
+
+            self.assertEqual(0, result)
+            self.assertEqual(1, len(sent_messages))
+            self.assertEqual(1, sent_messages[0].count("HTTP 500"))
+        finally:
+            main.authenticate_gspread = original_authenticate_gspread
+            main.open_sheet = original_open_sheet
+            main.send_email = original_send_email
+            main.connect_smtp = original_connect_smtp
+
+    def test_process_user_does_not_announce_episodes_when_sheet_write_fails(self):
+        session = FakeSession(
+            [FakeResponse(text='<p class="toggler">Odcinek 4</p>')]
+        )
+        worksheet = FakeWorksheet()
+        worksheet.batch_error = main.APIError(FakeApiErrorResponse())
+        sent_messages = []
+
+        original_authenticate_gspread = main.authenticate_gspread
+        original_open_sheet = main.open_sheet
+        original_send_email = main.send_email
+        original_connect_smtp = main.connect_smtp
+        try:
+            main.connect_smtp = lambda: None
+            main.authenticate_gspread = lambda service_account_file: object()
+            main.open_sheet = lambda gc, spreadsheet_title, worksheet_title: (
+                object(),
+                worksheet,
+            )
+
+            def fake_send_email(subject, html_body, email_to, server=None):
+                sent_messages.append(html_body)
+
+            main.send_email = fake_send_email
+
+            cfg = main.UserConfig(
+                sheet_title="dramy",
+                worksheet_title="Arkusz1",
+                email_to="example@example.com",
+                always_send=False,
+                service_account_file="service_account.json",
+            )
+
+            result = main.process_user(cfg, session, FakeAuthenticator())
+
+            self.assertEqual(0, result)
+            self.assertEqual(1, len(sent_messages))
+            self.assertIn("nowe odcinki nie zostały zapisane", sent_messages[0])
+            self.assertNotIn("Smoke Drama", sent_messages[0])
+        finally:
+            main.authenticate_gspread = original_authenticate_gspread
+            main.open_sheet = original_open_sheet
+            main.send_email = original_send_email
+            main.connect_smtp = original_connect_smtp
+
+    def test_process_user_closes_prepared_smtp_connection_on_unexpected_error(self):
+        session = FakeSession(
+            [FakeResponse(text='<p class="toggler">Odcinek 4</p>')]
+        )
+        worksheet = FakeWorksheet()
+        worksheet.batch_error = RuntimeError("nieoczekiwany błąd")
+        smtp_connection = FakeSmtpConnection()
+
+        original_authenticate_gspread = main.authenticate_gspread
+        original_open_sheet = main.open_sheet
+        original_connect_smtp = main.connect_smtp
+        try:
+            main.connect_smtp = lambda: smtp_connection
+            main.authenticate_gspread = lambda service_account_file: object()
+            main.open_sheet = lambda gc, spreadsheet_title, worksheet_title: (
+                object(),
+                worksheet,
+            )
+
+            cfg = main.UserConfig(
+                sheet_title="dramy",
+                worksheet_title="Arkusz1",
+                email_to="example@example.com",
+                always_send=True,
+                service_account_file="service_account.json",
+            )
+
+            with self.assertRaises(RuntimeError):
+                main.process_user(cfg, session, FakeAuthenticator())
+
+            self.assertTrue(smtp_connection.closed)
+        finally:
+            main.authenticate_gspread = original_authenticate_gspread
+            main.open_sheet = original_open_sheet
+            main.connect_smtp = original_connect_smtp
+
+
+class ReadSeriesTests(unittest.TestCase):
+    def test_read_series_reads_only_mapped_columns_with_typed_values(self):
+        worksheet = FakeWorksheet()
+        worksheet.values = [
+            ["lp", "tytuł", "url", "obejrzany", "na_stronie", "max_odcinek", "notatki"],
+            [1, "Typed Drama", "https://www.dramaqueen.pl/typed", 3, 4, 16, "x"],
+            [2, "Short Row", "https://www.dramaqueen.pl/short"],
+        ]
+
+        rows, header, mapping = main.read_series(worksheet)
+
+        self.assertEqual("lp", header[0])
+        self.assertEqual(1, mapping["nazwa"])
+        self.assertEqual(
+            ("Typed Drama", "https://www.dramaqueen.pl/typed", 3, 4, 16),
+            (
+                rows[0].nazwa,
+                rows[0].link,
+                rows[0].obejrzany_odcinek,
+                rows[0].odcinek_na_stronie,
+                rows[0].liczba_odcinków,
+            ),
+        )
+        self.assertEqual((3, "Short Row", 0), (rows[1].row_idx, rows[1].nazwa, rows[1].liczba_odcinków))
 
 
 if __name__ == "__main__":